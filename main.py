@@ -1,239 +1,714 @@
 import os
+import mmap
 import re
 import markdown
 import yaml
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemLoader, nodes
 import shutil
-from feedgen.feed import FeedGenerator
-from datetime import datetime
+from datetime import datetime, timezone
 import html
-import pytz
+from email.utils import format_datetime
 from urllib.parse import urljoin
 import traceback
+import hashlib
+import functools
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+_FRONTMATTER_RE = re.compile(r'^---\s*\n(.*?\n)---\s*\n', re.DOTALL)
+_EMBED_RE = re.compile(r'!\[\[(.+?)\]\]')
+_IMG_EXT_RE = re.compile(r'\.(png|jpe?g|gif)$', re.IGNORECASE)
+# Embeds, wikilinks and markdown images in a single alternation so content is
+# scanned once. Order matters: `![[` has to win over `[[` and `![`.
+_CONTENT_RE = re.compile(
+    r'!\[\[(?P<embed>.+?)\]\]'
+    r'|\[\[(?P<link>.+?)\]\]'
+    r'|!\[(?P<alt>.*?)\]\((?P<img>.+?)(?P<imgopts>\|.+?)?\)'
+)
+
+# How many levels of nested note embeds get expanded
+MAX_EMBED_DEPTH = 10
 
 def load_config(config_path):
     with open(config_path, 'r') as config_file:
         return yaml.safe_load(config_file)
 
+# Map the file and decode straight from the mapping instead of reading it
+# through a buffered text stream, which skips the intermediate bytes copy.
+# Newlines are normalized the way text mode would.
+# Returns the content and the file's mtime, taken from the open descriptor so
+# callers don't need a separate stat.
+def read_markdown(path):
+    with open(path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        if st.st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                content = str(mm, 'utf-8')
+        else:
+            content = ''  # Empty files can't be mapped
+    if '\r' in content:
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
+    return content, st.st_mtime
+
 def remove_frontmatter(content):
-    frontmatter_pattern = re.compile(r'^---\s*\n(.*?\n)---\s*\n', re.DOTALL)
-    return frontmatter_pattern.sub('', content)
+    return _FRONTMATTER_RE.sub('', content)
+
+# Frontmatter-stripped note embeds for the current build, keyed by path
+# (None for notes that don't exist)
+_embed_cache = {}
 
-def process_content(content, vault_path, output_path, config, depth=0):
+# Copy src to dst in the kernel with sendfile where that works, otherwise
+# through one reused buffer. Metadata is copied like shutil.copy2 does.
+def fast_copy(src, dst):
+    with open(src, 'rb', buffering=0) as fsrc, open(dst, 'wb', buffering=0) as fdst:
+        offset = 0
+        try:
+            while True:
+                sent = os.sendfile(fdst.fileno(), fsrc.fileno(), offset, 1 << 20)
+                if sent == 0:
+                    break
+                offset += sent
+        except (AttributeError, OSError):
+            # No sendfile, or it can't target regular files on this platform
+            fsrc.seek(offset)
+            fdst.seek(offset)
+            buffer = bytearray(256 * 1024)
+            view = memoryview(buffer)
+            while n := fsrc.readinto(buffer):
+                fdst.write(view[:n])
+    shutil.copystat(src, dst)
+
+# Images already placed in the output during this build, source -> destination
+_copied_images = {}
+
+def copy_image(src, src_stat, dst):
+    # Hardlinks and fast_copy both keep the source mtime, so an output image
+    # that is the same file, or has the same size and mtime, is already
+    # current. Comparing for equality also catches a source replaced by an
+    # older file.
+    try:
+        dst_stat = os.stat(dst)
+    except FileNotFoundError:
+        dst_stat = None
+
+    if dst_stat is None or not (os.path.samestat(src_stat, dst_stat)
+                                or (src_stat.st_size == dst_stat.st_size
+                                    and int(src_stat.st_mtime) == int(dst_stat.st_mtime))):
+        # Place the image under a name private to this process and rename it
+        # over dst, so workers racing on the same image never leave it missing
+        tmp_path = f'{dst}.{os.getpid()}.tmp'
+        try:
+            os.unlink(tmp_path)  # Left over from an interrupted build
+        except FileNotFoundError:
+            pass
+        try:
+            os.link(src, tmp_path)
+        except OSError:
+            # Different filesystem or no hardlink support
+            fast_copy(src, tmp_path)
+        os.replace(tmp_path, dst)
+
+    _copied_images[src] = dst
+
+def split_embed(embed):
+    parts = embed.split('|')
+    return parts[0].strip(), parts[1:]
+
+def is_image_path(path):
+    return _IMG_EXT_RE.search(path) is not None
+
+# Every file under the vault's attachments folder, as normalized paths
+# relative to the vault. Built once per build by index_attachments.
+_attachment_index = set()
+
+def index_attachments(vault_path):
+    attachments_path = os.path.join(vault_path, 'attachments')
+    index = set()
+    for root, _, files in os.walk(attachments_path):
+        rel_root = os.path.relpath(root, vault_path)
+        index.update(os.path.normpath(os.path.join(rel_root, name)) for name in files)
+    return index
+
+# The same images tend to be referenced from many places, so remember where
+# each one resolved to instead of looking it up again
+@functools.lru_cache(maxsize=4096)
+def resolve_image_path(path, vault_path):
+    # Check if the image path is relative
+    if os.path.isabs(path):
+        return path
+    # First, check in the attachments folder. The index answers the common
+    # case without a stat; on a miss, still ask the filesystem, since the walk
+    # doesn't descend into symlinked folders and case-insensitive filesystems
+    # match names the set doesn't.
+    attachment_path = os.path.join(vault_path, 'attachments', path)
+    if (os.path.normpath(os.path.join('attachments', path)) in _attachment_index
+            or os.path.exists(attachment_path)):
+        return attachment_path
+    # If not found in attachments, check in the vault root
+    return os.path.join(vault_path, path)
+
+def process_image(path, attributes, vault_path, output_path, deps, images):
+    # Initialize variables for additional attributes
+    size = None
+    float_direction = None
+    
+    # Process additional attributes
+    for attr in attributes:
+        attr = attr.strip().lower()
+        if attr in ['left', 'right']:
+            float_direction = attr
+        elif attr.isdigit():
+            size = attr
+
+    full_image_path = resolve_image_path(path, vault_path)
+
+    # Record what the page depends on so incremental builds notice changes,
+    # including the attachments location an image could still appear in
+    deps.add(full_image_path)
+    if not os.path.isabs(path):
+        deps.add(os.path.join(vault_path, 'attachments', path))
+
+    # Copy the image to the output directory ('images' is created up front
+    # by generate_site). An image already placed during this build needs no
+    # stat at all. Errors here are about the output and propagate.
+    image_filename = os.path.basename(full_image_path)
+    image_dst = os.path.join(output_path, 'images', image_filename)
+    if _copied_images.get(full_image_path) != image_dst:
+        try:
+            src_stat = os.stat(full_image_path)
+        except FileNotFoundError:
+            return None  # Return None if image not found
+        copy_image(full_image_path, src_stat, image_dst)
+    images.add(os.path.join('images', image_filename))
+
+    # Construct the image tag with appropriate attributes
+    img_tag = [f'<img src="images/{image_filename}" alt="{image_filename}"']
+    
+    if size:
+        img_tag.append(f' width="{size}"')
+    
+    if float_direction:
+        img_tag.append(f' style="float: {float_direction}; margin: 10px;"')
+    
+    img_tag.append('>')
+
+    return ''.join(img_tag)
+
+def expand_note_embed(match, vault_path, deps):
+    path, _ = split_embed(match.group(1))
+
+    # Image embeds are handled along with the other inline syntax
+    if is_image_path(path):
+        return match.group(0)
+
+    full_embed_path = os.path.join(vault_path, f"{path}.md")
+    deps.add(full_embed_path)
+
+    # The same note is often embedded many times, so only read it once.
+    # Missing notes are remembered too, as None.
+    if full_embed_path not in _embed_cache:
+        try:
+            _embed_cache[full_embed_path] = remove_frontmatter(read_markdown(full_embed_path)[0])
+        except FileNotFoundError:
+            _embed_cache[full_embed_path] = None
+
+    embed_content = _embed_cache[full_embed_path]
+    if embed_content is None:
+        return match.group(0)  # Return original if file not found
+    return embed_content
+
+def process_image_embed(match, vault_path, output_path, deps, images):
+    path, attributes = split_embed(match.group('embed'))
+    if not is_image_path(path):
+        return match.group(0)  # Note embed that couldn't be expanded
+    result = process_image(path, attributes, vault_path, output_path, deps, images)
+    return result if result is not None else match.group(0)
+
+def process_markdown_images(match, vault_path, output_path, deps, images):
+    path = match.group('img')
+    attributes_str = match.group('imgopts') or ''
+    attributes = attributes_str.strip('|').split('|') if attributes_str else []
+    
+    result = process_image(path, attributes, vault_path, output_path, deps, images)
+    return result if result is not None else match.group(0)
+
+def process_links(match, config):
+    link_parts = match.group('link').split('|')
+    link_text = link_parts[-1].strip()
+    link_target = link_parts[0].strip()
+    link_filename = link_target + '.md'
+
+    if link_filename in config['pages_set']:
+        return f'[{link_text}]({link_target}.html)'
+    else:
+        return link_text  # Remove brackets for non-config pages
+
+def process_content(content, vault_path, output_path, config, deps=None, images=None):
     if content is None:
         print("Warning: Received None content in process_content")
         return ""
 
-    if depth > 10:  # Prevent infinite recursion
+    # Plain markdown needs none of the processing below. Every embed, link
+    # and image contains one of these substrings.
+    if '[[' not in content and '![' not in content:
         return content
 
-    def process_image(path, attributes):
-        # Initialize variables for additional attributes
-        size = None
-        float_direction = None
-        
-        # Process additional attributes
-        for attr in attributes:
-            attr = attr.strip().lower()
-            if attr in ['left', 'right']:
-                float_direction = attr
-            elif attr.isdigit():
-                size = attr
-
-        # Check if the image path is relative
-        if not os.path.isabs(path):
-            # First, check in the attachments folder
-            full_image_path = os.path.join(vault_path, 'attachments', path)
-            if not os.path.exists(full_image_path):
-                # If not found in attachments, check in the vault root
-                full_image_path = os.path.join(vault_path, path)
-        else:
-            full_image_path = path
-
-        if os.path.exists(full_image_path):
-            # Create 'images' directory in the output path if it doesn't exist
-            output_images_dir = os.path.join(output_path, 'images')
-            os.makedirs(output_images_dir, exist_ok=True)
-
-            # Copy the image to the output directory
-            image_filename = os.path.basename(full_image_path)
-            shutil.copy2(full_image_path, os.path.join(output_images_dir, image_filename))
-
-            # Construct the image tag with appropriate attributes
-            img_tag = f'<img src="images/{image_filename}" alt="{image_filename}"'
-            
-            if size:
-                img_tag += f' width="{size}"'
-            
-            if float_direction:
-                img_tag += f' style="float: {float_direction}; margin: 10px;"'
-            
-            img_tag += '>'
-
-            return img_tag
-
-        return None  # Return None if image not found
-
-    def process_embeds(match):
-        embed_path = match.group(1)
-        parts = embed_path.split('|')
-        path = parts[0].strip()
-        attributes = parts[1:] if len(parts) > 1 else []
-        
-        # Check if it's an image embed or a note embed
-        if any(path.lower().endswith(ext) for ext in ['.png', '.jpg', '.jpeg', '.gif']):
-            result = process_image(path, attributes)
-            return result if result is not None else match.group(0)
-        else:
-            # It's a note embed
-            embed_filename = f"{path}.md"
-            full_embed_path = os.path.join(vault_path, embed_filename)
-            
-            if os.path.exists(full_embed_path):
-                with open(full_embed_path, 'r', encoding='utf-8') as embed_file:
-                    embed_content = embed_file.read()
-                embed_content = remove_frontmatter(embed_content)
-                return process_content(embed_content, vault_path, output_path, config, depth + 1)
-            return match.group(0)  # Return original if file not found
-
-    def process_markdown_images(match):
-        alt_text = match.group(1) or ''
-        path = match.group(2)
-        attributes_str = match.group(3) or ''
-        attributes = attributes_str.strip('|').split('|') if attributes_str else []
-        
-        result = process_image(path, attributes)
-        return result if result is not None else match.group(0)
-
-    def process_links(match):
-        link_parts = match.group(1).split('|')
-        link_text = link_parts[-1].strip()
-        link_target = link_parts[0].strip()
-        link_filename = link_target + '.md'
-
-        if link_filename in config['pages']:
-            return f'[{link_text}]({link_target}.html)'
+    if deps is None:
+        deps = set()
+    if images is None:
+        images = set()
+
+    # Expand note embeds in place, one level per pass, until nothing changes.
+    # The depth cap stops notes that embed themselves.
+    def expand(match):
+        return expand_note_embed(match, vault_path, deps)
+
+    for _ in range(MAX_EMBED_DEPTH + 1):
+        expanded = _EMBED_RE.sub(expand, content)
+        if expanded == content:
+            break
+        content = expanded
+
+    # Wikilinks, image embeds and markdown images in one pass, collecting the
+    # pieces and joining them once at the end
+    parts = []
+    last = 0
+    for match in _CONTENT_RE.finditer(content):
+        parts.append(content[last:match.start()])
+        if match.group('embed') is not None:
+            parts.append(process_image_embed(match, vault_path, output_path, deps, images))
+        elif match.group('link') is not None:
+            parts.append(process_links(match, config))
         else:
-            return link_text  # Remove brackets for non-config pages
-
-    # Apply all processing functions
-    content = re.sub(r'!\[\[(.+?)\]\]', process_embeds, content)
-    content = re.sub(r'\[\[(.+?)\]\]', process_links, content)
-    content = re.sub(r'!\[(.*?)\]\((.+?)(\|.+?)?\)', process_markdown_images, content)
-
-    return content
+            parts.append(process_markdown_images(match, vault_path, output_path, deps, images))
+        last = match.end()
+    if not parts:
+        return content
+    parts.append(content[last:])
+    return ''.join(parts)
 
 def generate_feeds(pages, output_path, config):
-    fg = FeedGenerator()
-    site_url = config.get('site_url', 'http://example.com')
-    fg.id(site_url)
-    fg.title(config.get('site_title', 'My Static Site'))
-    fg.author({'name': config.get('author_name', 'Site Author'), 
-               'email': config.get('author_email', 'author@example.com')})
-    fg.link(href=site_url, rel='alternate')
-    fg.logo(config.get('site_logo', 'http://ex.com/logo.jpg'))
-    fg.subtitle(config.get('site_description', 'A static site generated from Markdown files'))
-    fg.language('en')
-
-    utc_tz = pytz.UTC
-
-    for page in pages:
-        fe = fg.add_entry()
-        page_url = urljoin(site_url, page['link'])
-        fe.id(page_url)
-        fe.title(page['title'])
-        fe.link(href=page_url)
-        
+    # The feeds have a small fixed shape, so write the XML directly rather
+    # than building it element by element
+    site_url = html.escape(config.get('site_url', 'http://example.com'))
+    site_title = html.escape(config.get('site_title', 'My Static Site'))
+    site_description = html.escape(config.get('site_description', 'A static site generated from Markdown files'))
+    site_logo = html.escape(config.get('site_logo', 'http://ex.com/logo.jpg'))
+    author_name = html.escape(config.get('author_name', 'Site Author'))
+    author_email = html.escape(config.get('author_email', 'author@example.com'))
+
+    now = datetime.now(timezone.utc)
+
+    rss_items = []
+    atom_entries = []
+    # Oldest first, the same entry order feedgen used to produce
+    for page in reversed(pages):
+        page_url = html.escape(urljoin(config.get('site_url', 'http://example.com'), page['link']))
+        title = html.escape(page['title'], quote=False)
         # Use full content instead of summary
-        fe.content(content=page['content'], type='html')
-        
+        content = html.escape(page['content'], quote=False)
         # Use the last modified timestamp as both published and updated
-        last_modified_utc = page['last_modified'].astimezone(utc_tz)
-        fe.published(last_modified_utc)
-        fe.updated(last_modified_utc)
-
+        last_modified_utc = page['last_modified_utc']
+        rfc822_date = format_datetime(last_modified_utc)
+        iso_date = last_modified_utc.isoformat()
+
+        rss_items.append(
+            f'<item><title>{title}</title><link>{page_url}</link>'
+            f'<description>{content}</description>'
+            f'<guid isPermaLink="false">{page_url}</guid>'
+            f'<pubDate>{rfc822_date}</pubDate></item>'
+        )
+        atom_entries.append(
+            f'<entry><id>{page_url}</id><title>{title}</title>'
+            f'<updated>{iso_date}</updated>'
+            f'<content type="html">{content}</content>'
+            f'<link href="{page_url}"/><published>{iso_date}</published></entry>'
+        )
+
+    rss = ''.join([
+        "<?xml version='1.0' encoding='UTF-8'?>\n",
+        '<rss version="2.0"><channel>',
+        f'<title>{site_title}</title><link>{site_url}</link>',
+        f'<description>{site_description}</description>',
+        f'<image><url>{site_logo}</url><title>{site_title}</title><link>{site_url}</link></image>',
+        f'<language>en</language><lastBuildDate>{format_datetime(now)}</lastBuildDate>',
+        *rss_items,
+        '</channel></rss>\n',
+    ])
     rss_path = os.path.join(output_path, 'rss.xml')
-    fg.rss_file(rss_path)
+    with open(rss_path, 'w', encoding='utf-8') as f:
+        f.write(rss)
     print(f"RSS feed generated: {rss_path}")
 
+    atom = ''.join([
+        "<?xml version='1.0' encoding='UTF-8'?>\n",
+        '<feed xmlns="http://www.w3.org/2005/Atom" xml:lang="en">',
+        f'<id>{site_url}</id><title>{site_title}</title><updated>{now.isoformat()}</updated>',
+        f'<author><name>{author_name}</name><email>{author_email}</email></author>',
+        f'<link href="{site_url}" rel="alternate"/>',
+        f'<logo>{site_logo}</logo><subtitle>{site_description}</subtitle>',
+        *atom_entries,
+        '</feed>\n',
+    ])
     atom_path = os.path.join(output_path, 'atom.xml')
-    fg.atom_file(atom_path)
+    with open(atom_path, 'w', encoding='utf-8') as f:
+        f.write(atom)
     print(f"Atom feed generated: {atom_path}")
 
-def generate_site(config):
+# Per-process state for render_page, filled in by init_worker. Each worker
+# builds its own Jinja environment and Markdown instance since neither can be
+# shared across processes. The Markdown instance is built once per worker and
+# reset between pages rather than rebuilt, which would re-create the whole
+# extension and processor chain every time.
+_worker_state = {}
+
+MARKDOWN_EXTENSIONS = ['tables', 'fenced_code']
+MANIFEST_FILENAME = '.build_manifest.json'
+
+# Whether an output expression is one the prejoined page.html can fill in by
+# plain substitution: a bare {{ title }} or {{ content | safe }}
+def page_template_slot(node):
+    if isinstance(node, nodes.Name) and node.name == 'title':
+        return 'title'
+    if (isinstance(node, nodes.Filter) and node.name == 'safe'
+            and isinstance(node.node, nodes.Name) and node.node.name == 'content'
+            and not node.args and not node.kwargs
+            and node.dyn_args is None and node.dyn_kwargs is None):
+        return 'content'
+    return None
+
+# page.html only substitutes content and title, so split it once into static
+# text and slots and write each page as those pieces around its values. Any
+# other construct (tags, other variables, filters, autoescaping) is streamed
+# through Jinja as usual. Either way the page goes straight into the file
+# without being assembled into one string first.
+def compile_page_template(env):
+    template = env.get_template('page.html')
+
+    def stream(f, **context):
+        template.stream(**context).dump(f)
+
+    if env.autoescape or env.finalize is not None:
+        return stream
+
+    source = env.loader.get_source(env, 'page.html')[0]
+    pieces = []
+    for output in env.parse(source).body:
+        if not isinstance(output, nodes.Output):
+            return stream
+        for node in output.nodes:
+            if isinstance(node, nodes.TemplateData):
+                pieces.append((False, node.data))
+                continue
+            slot = page_template_slot(node)
+            if slot is None:
+                return stream
+            pieces.append((True, slot))
+
+    def write_pieces(f, **context):
+        for is_slot, piece in pieces:
+            f.write(str(context[piece]) if is_slot else piece)
+
+    return write_pieces
+
+def init_worker(config, attachment_index):
+    _embed_cache.clear()
+    _copied_images.clear()
+    _attachment_index.clear()
+    _attachment_index.update(attachment_index)
+    resolve_image_path.cache_clear()
+    env = Environment(loader=FileSystemLoader('templates'))
+    _worker_state['config'] = config
+    _worker_state['local_tz'] = datetime.now().astimezone().tzinfo
+    _worker_state['write_page_html'] = compile_page_template(env)
+    _worker_state['md'] = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+
+    # Keep the output directory open so opening each page for writing doesn't
+    # resolve the full path again
+    if os.open in os.supports_dir_fd:
+        _worker_state['output_dir_fd'] = os.open(config['output_path'],
+                                                 os.O_RDONLY | os.O_DIRECTORY)
+
+def close_worker():
+    dir_fd = _worker_state.pop('output_dir_fd', None)
+    if dir_fd is not None:
+        os.close(dir_fd)
+
+def open_output_file(output_file):
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+    dir_fd = _worker_state.get('output_dir_fd')
+    if dir_fd is not None:
+        fd = os.open(output_file, flags, 0o644, dir_fd=dir_fd)
+    else:
+        fd = os.open(os.path.join(_worker_state['config']['output_path'], output_file), flags, 0o644)
+    return open(fd, 'w', encoding='utf-8')
+
+# Workers share stdout, so write each progress line in a single call and flush
+# it right away; otherwise lines from different workers run together
+def worker_print(message):
+    print(message + '\n', end='', flush=True)
+
+# Render one page. When the manifest entry is passed in, the page's source is
+# unchanged and only the template needs applying to the stored HTML.
+def render_page(task):
+    index, total_pages, page, cached_entry = task
+    config = _worker_state['config']
+    write_page_html = _worker_state['write_page_html']
+    md = _worker_state['md']
     vault_path = config['vault_path']
     output_path = config['output_path']
-    pages = config['pages']
 
-    os.makedirs(output_path, exist_ok=True)
+    markdown_path = os.path.join(vault_path, page)
+    stem = os.path.splitext(page)[0]
+    output_file = stem + '.html'
 
-    env = Environment(loader=FileSystemLoader('templates'))
-    page_template = env.get_template('page.html')
-    index_template = env.get_template('index.html')
+    if cached_entry is not None:
+        worker_print(f"Re-rendering file {index}/{total_pages}: {page}")
+        page_info = entry_page_info(cached_entry)
+        try:
+            with open_output_file(page_info['link']) as f:
+                write_page_html(
+                    f,
+                    content=page_info['content'],
+                    title=page_info['title'],
+                    # Same local time a freshly converted page gets
+                    last_modified=page_info['last_modified'].astimezone(_worker_state['local_tz'])
+                )
+            return page, page_info, cached_entry
+        except Exception as e:
+            worker_print(f"Error processing {page}: {str(e)}")
+            traceback.print_exc()
+            return None
 
-    md = markdown.Markdown(extensions=['tables', 'fenced_code'])
+    worker_print(f"Processing file {index}/{total_pages}: {page}")
 
-    style_src = os.path.join('templates', 'style.css')
-    style_dst = os.path.join(output_path, 'style.css')
-    if os.path.exists(style_src):
-        shutil.copy(style_src, style_dst)
-        print(f"Copied style.css to {style_dst}")
-    else:
-        print("Warning: style.css not found in templates folder")
+    try:
+        content, src_mtime = read_markdown(markdown_path)
 
-    processed_pages = []
-    total_pages = len(pages)
-    for index, page in enumerate(pages, start=1):
-        print(f"Processing file {index}/{total_pages}: {page}")
+        # Get the last modification time for the file
+        last_modified = datetime.fromtimestamp(src_mtime).replace(tzinfo=_worker_state['local_tz'])
 
-        markdown_path = os.path.join(vault_path, page)
-        output_file = os.path.splitext(page)[0] + '.html'
-        output_file_path = os.path.join(output_path, output_file)
+        content = remove_frontmatter(content)
+        deps = set()
+        images = set()
+        processed_content = process_content(content, vault_path, output_path, config,
+                                            deps=deps, images=images)
 
+        # The worker's Markdown instance is reused for every page it handles,
+        # so drop this page's references/footnotes as soon as it's converted,
+        # even if conversion fails part way
         try:
-            # Get the last modification time for the file
-            local_tz = datetime.now().astimezone().tzinfo
-            last_modified = datetime.fromtimestamp(
-                os.path.getmtime(markdown_path)
-            ).replace(tzinfo=local_tz)
-
-            with open(markdown_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-
-            content = remove_frontmatter(content)
-            processed_content = process_content(content, vault_path, output_path, config)
-
             html_content = md.convert(processed_content)
+        finally:
+            md.reset()
 
-            page_html = page_template.render(
+        with open_output_file(output_file) as f:
+            write_page_html(
+                f,
                 content=html_content,
-                title=os.path.splitext(page)[0],
+                title=stem,
                 last_modified=last_modified
             )
 
-            with open(output_file_path, 'w', encoding='utf-8') as f:
-                f.write(page_html)
-
-            processed_pages.append({
-                'title': os.path.splitext(page)[0],
-                'link': output_file,
-                'content': html_content,
-                'last_modified': last_modified
-            })
+        worker_print(f"Converted {page} to {output_file} (Last modified: {last_modified})")
+        # Local time for the page template, UTC for the feeds
+        page_info = {
+            'title': stem,
+            'link': output_file,
+            'content': html_content,
+            'last_modified': last_modified,
+            'last_modified_utc': last_modified.astimezone(timezone.utc)
+        }
+        manifest_entry = {
+            'src_mtime': src_mtime,
+            # Relative to the vault, since the manifest is published with the site
+            'deps': {os.path.relpath(dep, vault_path): path_mtime(dep) for dep in deps},
+            'images': sorted(images),
+            'page': dict(page_info,
+                         last_modified=page_info['last_modified'].isoformat(),
+                         last_modified_utc=page_info['last_modified_utc'].isoformat())
+        }
+        return page, page_info, manifest_entry
+    except Exception as e:
+        worker_print(f"Error processing {page}: {str(e)}")
+        traceback.print_exc()
+        return None
 
-            print(f"Converted {page} to {output_file} (Last modified: {last_modified})")
-        except Exception as e:
-            print(f"Error processing {page}: {str(e)}")
-            traceback.print_exc()
+def path_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+# page.html can include or extend any other template, so a change to any file
+# under the template folder means re-rendering every page
+def template_mtimes(template_dir):
+    mtimes = {}
+    for root, _, files in os.walk(template_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            mtimes[os.path.relpath(path, template_dir)] = path_mtime(path)
+    return mtimes
+
+def build_key(config):
+    # Anything that changes the converted HTML of every page: the config
+    # (page list, site metadata), the markdown extensions and version, and
+    # the generator's own code. The page template is tracked separately since
+    # it only needs re-applying.
+    config_dump = json.dumps(config, sort_keys=True,
+                             default=lambda o: sorted(o) if isinstance(o, set) else str(o))
+    with open(__file__, 'rb') as f:
+        generator_hash = hashlib.sha1(f.read()).hexdigest()
+    return {
+        'config': hashlib.sha1(config_dump.encode('utf-8')).hexdigest(),
+        'extensions': MARKDOWN_EXTENSIONS,
+        'markdown': markdown.__version__,
+        'generator': generator_hash
+    }
+
+def load_manifest(output_path):
+    manifest_path = os.path.join(output_path, MANIFEST_FILENAME)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(output_path, key, template_mtimes, entries):
+    manifest_path = os.path.join(output_path, MANIFEST_FILENAME)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'key': key, 'template_mtimes': template_mtimes, 'pages': entries}, f)
+    os.replace(tmp_path, manifest_path)
+
+# Delete the HTML of pages that were built before but are no longer listed in
+# the config. Only files recorded in the manifest are touched, since the
+# output directory also holds files the generator doesn't own.
+def remove_stale_pages(output_path, old_entries, pages):
+    current = set(pages)
+    for page, entry in old_entries.items():
+        if page in current:
             continue
+        stale_path = os.path.join(output_path, entry['page']['link'])
+        try:
+            os.unlink(stale_path)
+            print(f"Removed stale page {stale_path}")
+        except FileNotFoundError:
+            pass
+
+# Whether a manifest entry's converted HTML is still valid, i.e. neither the
+# page's source nor any note or image it pulls in has changed, and the images
+# it placed in the output are still there
+def entry_is_current(entry, vault_path, output_path, page):
+    if entry is None:
+        return False
+    if path_mtime(os.path.join(vault_path, page)) != entry['src_mtime']:
+        return False
+    images = entry.get('images')  # Missing in manifests from older builds
+    if images is None or not all(os.path.exists(os.path.join(output_path, image)) for image in images):
+        return False
+    return all(path_mtime(os.path.join(vault_path, dep)) == mtime
+               for dep, mtime in entry['deps'].items())
+
+def entry_page_info(entry):
+    page_info = entry['page']
+    return dict(page_info,
+                last_modified=datetime.fromisoformat(page_info['last_modified']),
+                last_modified_utc=datetime.fromisoformat(page_info['last_modified_utc']))
+
+def generate_site(config):
+    vault_path = config['vault_path']
+    output_path = config['output_path']
+    pages = config['pages']
+
+    os.makedirs(output_path, exist_ok=True)
+    os.makedirs(os.path.join(output_path, 'images'), exist_ok=True)
+    _embed_cache.clear()
+    _copied_images.clear()
+
+    # process_links checks every wikilink against the page list
+    config['pages_set'] = set(pages)
+
+    key = build_key(config)
+    old_manifest = load_manifest(output_path)
+    remove_stale_pages(output_path, old_manifest.get('pages', {}), pages)
+    if old_manifest.get('key') == key:
+        manifest = old_manifest['pages']
+    else:
+        print("Build configuration changed, rebuilding all pages")
+        manifest = {}
+    templates = template_mtimes('templates')
+    template_changed = old_manifest.get('template_mtimes') != templates
+    new_manifest = {}
+    processed_pages = []
+
+    env = Environment(loader=FileSystemLoader('templates'))
+    index_template = env.get_template('index.html')
+
+    # Only pages whose source or embedded notes/images changed get converted
+    # again. Unchanged pages reuse their stored HTML, and are only re-rendered
+    # if the template changed or their output file went missing.
+    total_pages = len(pages)
+    tasks = []
+    for index, page in enumerate(pages, start=1):
+        entry = manifest.get(page)
+        if not entry_is_current(entry, vault_path, output_path, page):
+            tasks.append((index, total_pages, page, None))
+        elif template_changed or not os.path.exists(os.path.join(output_path, entry['page']['link'])):
+            tasks.append((index, total_pages, page, entry))
+        else:
+            print(f"Skipping unchanged file {index}/{total_pages}: {page}")
+            processed_pages.append(entry_page_info(entry))
+            new_manifest[page] = entry
+
+    # One directory walk instead of probing for each referenced image, and
+    # none at all when every page is skipped
+    attachment_index = index_attachments(vault_path) if tasks else set()
+
+    # Pages are independent of each other, so convert them across all cores.
+    # Starting worker processes isn't worth it for a single page or core.
+    max_workers = min(os.cpu_count() or 1, len(tasks))
+    if max_workers > 1:
+        chunksize = max(1, len(tasks) // (max_workers * 4))
+        executor = ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                                       initargs=(config, attachment_index))
+        results = executor.map(render_page, tasks, chunksize=chunksize)
+    else:
+        executor = None
+        init_worker(config, attachment_index)
+        results = map(render_page, tasks)
+
+    try:
+        # With a pool, map() has already queued every page, so this copy
+        # overlaps with the workers' reads and writes
+        style_src = os.path.join('templates', 'style.css')
+        style_dst = os.path.join(output_path, 'style.css')
+        if os.path.exists(style_src):
+            shutil.copy(style_src, style_dst)
+            print(f"Copied style.css to {style_dst}")
+        else:
+            print("Warning: style.css not found in templates folder")
+
+        for result in results:
+            if result is not None:
+                page, page_info, manifest_entry = result
+                processed_pages.append(page_info)
+                new_manifest[page] = manifest_entry
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        else:
+            close_worker()
+
+    save_manifest(output_path, key, templates, new_manifest)
 
     # Sort pages by last modified timestamp, newest first
     processed_pages.sort(key=lambda x: x['last_modified'], reverse=True)
 
     print("Generating index.html...")
-    index_html = index_template.render(pages=processed_pages)
-    with open(os.path.join(output_path, 'index.html'), 'w', encoding='utf-8') as f:
-        f.write(index_html)
+    index_template.stream(pages=processed_pages).dump(
+        os.path.join(output_path, 'index.html'), encoding='utf-8'
+    )
     print("index.html generated")
 
     print("Generating RSS and Atom feeds...")